@@ -1,4 +1,5 @@
 import argparse
+import asyncio
 import json
 import logging
 import pathlib
@@ -19,15 +20,65 @@ from starlette.templating import _TemplateResponse, Jinja2Templates
 DATE_FMT = "%Y-%m-%d"
 LOGGER = logging.getLogger(__name__)
 TEMPLATES = Jinja2Templates(directory="templates")
+MAX_CONCURRENCY = 8
+MAX_QUEUE_DEPTH = 32
+RETRY_AFTER = 1
+
+
+class _Overloaded(Exception):
+    """Raised when more database work is queued than the server admits."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class _DatabaseGate:
+    """
+    Bounds the number of concurrent database calls. Callers beyond the limit
+    wait in line until `max_queue_depth` callers are waiting; after that,
+    further callers are rejected with `_Overloaded` instead of piling up.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue_depth: int, retry_after: int):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        if max_queue_depth < 0:
+            raise ValueError("max_queue_depth must not be negative")
+        if retry_after < 0:
+            raise ValueError("retry_after must not be negative")
+
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.retry_after = retry_after
+        self._semaphore: typing.Optional[asyncio.Semaphore] = None
+        self._queued = 0
+
+    async def __aenter__(self) -> None:
+        # The semaphore is created lazily so it binds to the running loop.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self._semaphore.locked() and self._queued >= self.max_queue_depth:
+            raise _Overloaded(retry_after=self.retry_after)
+        self._queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._queued -= 1
+
+    async def __aexit__(self, *exc_info) -> None:
+        assert self._semaphore is not None
+        self._semaphore.release()
 
 
 async def document_by_id(request: Request) -> Response:
     """Returns the PDF specified by `document_id`."""
 
     database_path = request.app.state.database_path
+    gate = request.app.state.database_gate
     postings_id = request.path_params["postings_id"]
     document = await _retrieve_document_by_id(
-        database_path=database_path, postings_id=postings_id
+        database_path=database_path, postings_id=postings_id, gate=gate
     )
     LOGGER.info(_retrieve_document_by_id.cache_info())
 
@@ -37,6 +88,7 @@ async def document_by_id(request: Request) -> Response:
 async def homepage(request: Request) -> _TemplateResponse:
     """The landing page that presents a list of job postings."""
     database_path = request.app.state.database_path
+    gate = request.app.state.database_gate
     today = date.today().strftime(DATE_FMT)
 
     query = """
@@ -45,9 +97,10 @@ async def homepage(request: Request) -> _TemplateResponse:
     WHERE date(deadline) >= ?
     ORDER BY date(deadline) ASC;
     """
-    async with aiosqlite.connect(database_path) as connection:
-        async with connection.execute(query, [today]) as cursor:
-            postings = await cursor.fetchall()
+    async with gate:
+        async with aiosqlite.connect(database_path) as connection:
+            async with connection.execute(query, [today]) as cursor:
+                postings = await cursor.fetchall()
 
     return TEMPLATES.TemplateResponse(
         "index.html", {"request": request, "postings": postings}
@@ -57,33 +110,56 @@ async def homepage(request: Request) -> _TemplateResponse:
 async def result_page(request: Request) -> _TemplateResponse:
     """The result page for keyword searches."""
     database_path = request.app.state.database_path
+    gate = request.app.state.database_gate
     keyword = request.query_params["search_keyword"]
     today = date.today().strftime(DATE_FMT)
 
     postings = await _filter_postings_by_keyword(
-        database_path=database_path, keyword=keyword, date=today
+        database_path=database_path, keyword=keyword, date=today, gate=gate
     )
     return TEMPLATES.TemplateResponse(
         "index.html", {"request": request, "postings": postings}
     )
 
 
-def _build_app(database_path: str) -> Starlette:
+async def service_unavailable(request: Request, exc: _Overloaded) -> Response:
+    """Sheds load with a fast 503 while the database queue is full."""
+    return Response(
+        "Service temporarily overloaded, please retry.",
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def _build_app(
+    database_path: str,
+    max_concurrency: int = MAX_CONCURRENCY,
+    max_queue_depth: int = MAX_QUEUE_DEPTH,
+    retry_after: int = RETRY_AFTER,
+) -> Starlette:
     routes = [
         Route("/", homepage),
         Route("/documents/{postings_id:int}", document_by_id, name="documents"),
         Route("/results", result_page, name="results"),
         Mount("/static", app=StaticFiles(directory="static"), name="static"),
     ]
-    _app = Starlette(debug=True, routes=routes)
+    exception_handlers: typing.Dict[typing.Any, typing.Callable] = {
+        _Overloaded: service_unavailable
+    }
+    _app = Starlette(debug=True, routes=routes, exception_handlers=exception_handlers)
     _app.state.database_path = str(pathlib.Path(database_path))
+    _app.state.database_gate = _DatabaseGate(
+        max_concurrency=max_concurrency,
+        max_queue_depth=max_queue_depth,
+        retry_after=retry_after,
+    )
 
     return _app
 
 
-@async_lru.alru_cache(maxsize=32)
+@async_lru.alru_cache(maxsize=32, cache_exceptions=False)
 async def _filter_postings_by_keyword(
-    database_path: str, keyword: str, date: str
+    database_path: str, keyword: str, date: str, gate: _DatabaseGate
 ) -> typing.Awaitable[typing.List]:
     query = """
     SELECT m.postings_id, m.title, m.superior, m.institution, date(m.deadline)
@@ -93,14 +169,15 @@ async def _filter_postings_by_keyword(
     WHERE date(m.deadline) >= ? AND f.text MATCH ?
     ORDER BY date(m.deadline) ASC;
     """
-    async with aiosqlite.connect(database_path) as connection:
-        async with connection.execute(query, [date, keyword]) as cursor:
-            return await cursor.fetchall()
+    async with gate:
+        async with aiosqlite.connect(database_path) as connection:
+            async with connection.execute(query, [date, keyword]) as cursor:
+                return await cursor.fetchall()
 
 
-@async_lru.alru_cache(maxsize=32)
+@async_lru.alru_cache(maxsize=32, cache_exceptions=False)
 async def _retrieve_document_by_id(
-    database_path: str, postings_id: int
+    database_path: str, postings_id: int, gate: _DatabaseGate
 ) -> typing.AsyncGenerator[bytes, None]:
     query = """
     SELECT document
@@ -108,9 +185,10 @@ async def _retrieve_document_by_id(
     WHERE postings_id = ?
     ORDER BY document ASC, postings_id ASC
     """
-    async with aiosqlite.connect(database_path) as connection:
-        async with connection.execute(query, [postings_id]) as cursor:
-            document = await cursor.fetchone()
+    async with gate:
+        async with aiosqlite.connect(database_path) as connection:
+            async with connection.execute(query, [postings_id]) as cursor:
+                document = await cursor.fetchone()
 
     return document[0]
 
@@ -122,8 +200,31 @@ if __name__ == "__main__":
     PARSER.add_argument(
         "database_path", type=str, help="database path to sqlite3 instance",
     )
+    PARSER.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=MAX_CONCURRENCY,
+        help="maximum number of concurrent database calls",
+    )
+    PARSER.add_argument(
+        "--max-queue-depth",
+        type=int,
+        default=MAX_QUEUE_DEPTH,
+        help="maximum number of queued database calls before answering 503",
+    )
+    PARSER.add_argument(
+        "--retry-after",
+        type=int,
+        default=RETRY_AFTER,
+        help="seconds sent in the Retry-After header of 503 responses",
+    )
     ARGS = PARSER.parse_args()
 
-    APP = _build_app(database_path=ARGS.database_path)
+    APP = _build_app(
+        database_path=ARGS.database_path,
+        max_concurrency=ARGS.max_concurrency,
+        max_queue_depth=ARGS.max_queue_depth,
+        retry_after=ARGS.retry_after,
+    )
     uvloop.install()
     uvicorn.run(APP, host="127.0.0.1", port=5000, log_level="info")
@@ -0,0 +1,141 @@
+import asyncio
+import pathlib
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from starlette.testclient import TestClient
+
+import server
+
+
+def _create_database(database_path: str):
+    connection = sqlite3.connect(database_path)
+    with connection:
+        connection.execute(
+            """
+            CREATE TABLE metadata(
+                postings_id INTEGER,
+                title TEXT,
+                superior TEXT,
+                institution TEXT,
+                deadline TEXT
+            );
+            """
+        )
+        connection.execute(
+            "CREATE TABLE documents(postings_id INTEGER, document BLOB);"
+        )
+        connection.execute(
+            "INSERT INTO documents(postings_id, document) VALUES (?, ?);",
+            [1, b"%PDF-1.4"],
+        )
+    connection.close()
+
+
+class DatabaseGateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_full_queue_raises_overloaded(self):
+        gate = server._DatabaseGate(max_concurrency=1, max_queue_depth=1, retry_after=7)
+
+        async def scenario():
+            await gate.__aenter__()
+            waiter = asyncio.ensure_future(gate.__aenter__())
+            await asyncio.sleep(0)
+            with self.assertRaises(server._Overloaded) as context:
+                await gate.__aenter__()
+            await gate.__aexit__(None, None, None)
+            await waiter
+            await gate.__aexit__(None, None, None)
+            return context.exception
+
+        exception = self.loop.run_until_complete(scenario())
+
+        self.assertEqual(7, exception.retry_after)
+
+    def test_cancelled_waiter_leaves_queue(self):
+        gate = server._DatabaseGate(max_concurrency=1, max_queue_depth=1, retry_after=1)
+
+        async def scenario():
+            await gate.__aenter__()
+            waiter = asyncio.ensure_future(gate.__aenter__())
+            await asyncio.sleep(0)
+            self.assertEqual(1, gate._queued)
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            await gate.__aexit__(None, None, None)
+
+        self.loop.run_until_complete(scenario())
+
+        self.assertEqual(0, gate._queued)
+
+    def test_invalid_limits_are_rejected(self):
+        with self.assertRaises(ValueError):
+            server._DatabaseGate(max_concurrency=0, max_queue_depth=0, retry_after=0)
+        with self.assertRaises(ValueError):
+            server._DatabaseGate(max_concurrency=1, max_queue_depth=-1, retry_after=0)
+        with self.assertRaises(ValueError):
+            server._DatabaseGate(max_concurrency=1, max_queue_depth=0, retry_after=-1)
+
+
+class ServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database_path = str(pathlib.Path(self.directory.name) / "postings.db")
+        _create_database(self.database_path)
+        self.app = server._build_app(
+            database_path=self.database_path, max_concurrency=1, max_queue_depth=0
+        )
+        self.gate = self.app.state.database_gate
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_full_queue_responds_with_503(self):
+        client = TestClient(self.app)
+        # The test client runs requests on the default event loop, so the
+        # gate's only slot is taken on that same loop.
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(self.gate.__aenter__())
+
+        response = client.get("/")
+
+        self.assertEqual(503, response.status_code)
+        self.assertEqual("1", response.headers["Retry-After"])
+
+        loop.run_until_complete(self.gate.__aexit__(None, None, None))
+        response = client.get("/")
+
+        self.assertEqual(200, response.status_code)
+
+    def test_concurrent_identical_misses_query_once(self):
+        gate = server._DatabaseGate(
+            max_concurrency=1, max_queue_depth=16, retry_after=1
+        )
+
+        async def scenario():
+            return await asyncio.gather(
+                *[
+                    server._retrieve_document_by_id(
+                        database_path=self.database_path, postings_id=1, gate=gate
+                    )
+                    for _ in range(10)
+                ]
+            )
+
+        with mock.patch.object(
+            server.aiosqlite, "connect", wraps=server.aiosqlite.connect
+        ) as connect:
+            loop = asyncio.new_event_loop()
+            documents = loop.run_until_complete(scenario())
+            loop.close()
+
+        self.assertListEqual([b"%PDF-1.4"] * 10, documents)
+        self.assertEqual(1, connect.call_count)